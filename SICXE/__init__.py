@@ -0,0 +1,3 @@
+"""
+SIC/XE Assembler package
+"""
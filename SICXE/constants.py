@@ -3,10 +3,11 @@
 Constants for SIC/XE Assembler
 Contains opcodes, registers, and other constants needed for assembly
 """
+from types import MappingProxyType
 
 # SIC/XE Instruction opcodes with format information
 # Format: opcode -> (hex_value, format_number)
-OPCODES = {
+OPCODES = MappingProxyType({
     # Format 3/4 instructions
     'CADD': ('18', 3),  # Conditional ADD
     'ADD': ('18', 3),
@@ -69,10 +70,13 @@ OPCODES = {
     'NORM': ('C8', 1),
     'SIO': ('F0', 1),
     'TIO': ('F8', 1),
-}
+})
+
+# Mnemonic set for fast membership tests (no value fetch through the proxy)
+OPCODE_SET = frozenset(OPCODES)
 
 # Register codes for Format 2 instructions
-REGISTERS = {
+REGISTERS = MappingProxyType({
     'A': 0,
     'X': 1,
     'L': 2,
@@ -83,9 +87,9 @@ REGISTERS = {
     'PC': 8,
     'SW': 9,
     'Z': 0,  # Added Z register (sometimes used as synonym for A register)
-}
+})
 
 # Assembler directives
-DIRECTIVES = {
+DIRECTIVES = frozenset({
     'START', 'END', 'BYTE', 'WORD', 'RESB', 'RESW', 'BASE', 'NOBASE'
-}
\ No newline at end of file
+})
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+One-pass SIC/XE Assembler
+Builds the symbol table and generates object code in a single scan,
+back-patching instructions that reference symbols defined later
+"""
+from .utils import parse_operand, is_number, format_hex, byte_to_object_code
+from .constants import DIRECTIVES
+from .pass1 import enhanced_parse_line, statement_size
+from .pass2 import encode_instruction, build_text_records
+
+def _is_forward_ref(operand, symbol_table):
+    """Check if an operand names a symbol that is not defined yet"""
+    try:
+        value = parse_operand(operand)[0]
+    except Exception:
+        # Let the code generator report unparsable operands
+        return False
+    return bool(value) and not is_number(value) and value not in symbol_table
+
+def _resolve_base(base, symbol_table):
+    """Resolve a BASE operand that was still undefined when it was seen"""
+    if isinstance(base, str):
+        if base not in symbol_table:
+            raise ValueError(f"Invalid BASE operand: {base}")
+        return symbol_table[base]
+    return base
+
+def assemble(intermediate_lines):
+    """
+    Assemble the program in one scan of the source lines.
+    Instructions that reference a symbol not yet defined (or that depend on
+    a BASE register set from one) are recorded in a back-patch list and
+    encoded once the symbol table is complete.
+    Returns the same values as pass1 and pass2 combined, followed by the
+    number of lines with errors that were only reported.
+    """
+    symbol_table = {}
+    locctr = 0
+    start_addr = 0
+    program_name = None
+    pass1_output = []
+    error_count = 0
+    
+    # Each entry: [address, source line, object code, mod records, flushes text]
+    # Object code None marks a line that is only listed (labels, START, END)
+    entries = []
+    # Back-patch list: (entry index, line_num, opcode, operand, base)
+    fixups = []
+    # Either None, an address, or the name of a not yet defined symbol
+    base = None
+    
+    for line_num, line in enumerate(intermediate_lines, 1):
+        label, opcode, operand = enhanced_parse_line(line)
+        
+        # Lines without an opcode are only listed
+        if not opcode:
+            if line.strip():
+                pass1_output.append(f"{locctr:04X} {line}")
+                entries.append([locctr, line, None, [], False])
+            continue
+        
+        # Handle START directive
+        if opcode == 'START':
+            if operand:
+                try:
+                    start_addr = int(operand) if is_number(operand) else int(operand, 16)
+                except ValueError:
+                    raise ValueError(f"Line {line_num}: Invalid START operand: {operand}")
+                locctr = start_addr
+            if label:
+                program_name = label
+            pass1_output.append(f"{locctr:04X} {line}")
+            entries.append([locctr, line, None, [], False])
+            continue
+        
+        current_locctr = locctr
+        
+        # Add label to symbol table
+        if label:
+            if label in symbol_table:
+                raise ValueError(f"Line {line_num}: Duplicate label: {label}")
+            symbol_table[label] = current_locctr
+        
+        if opcode == 'END':
+            pass1_output.append(f"{current_locctr:04X} {line}")
+            entries.append([current_locctr, line, None, [], False])
+            break
+        
+        pass1_output.append(f"{current_locctr:04X} {line}")
+        object_code = ""
+        mods = []
+        flush = False
+        
+        size = statement_size(opcode, operand, line_num)
+        if size is None:
+            print(f"Warning: Line {line_num}: Unknown opcode or directive: {opcode}")
+            error_count += 1
+            entries.append([current_locctr, line, "", mods, False])
+            continue
+        locctr += size
+        
+        if opcode in DIRECTIVES:
+            if opcode == 'WORD':
+                if not (operand and is_number(operand)):
+                    raise ValueError(f"Invalid WORD operand: {operand}")
+                object_code = format_hex(int(operand), 6)
+            elif opcode == 'BYTE':
+                object_code = byte_to_object_code(operand)
+            elif opcode in ('RESW', 'RESB'):
+                flush = True
+            elif opcode == 'BASE':
+                if operand in symbol_table:
+                    base = symbol_table[operand]
+                elif is_number(operand):
+                    base = int(operand)
+                elif operand:
+                    # Possibly a forward reference; resolved when back-patching
+                    base = operand
+                else:
+                    raise ValueError(f"Invalid BASE operand: {operand}")
+        else:
+            # Format 3/4 operands may need symbols defined further down
+            if size >= 3 and operand and (
+                    _is_forward_ref(operand, symbol_table) or
+                    (size == 3 and isinstance(base, str))):
+                fixups.append((len(entries), line_num, opcode, operand, base))
+            else:
+                object_code = encode_instruction(opcode, operand, symbol_table, current_locctr,
+                                                 base, mods, line_num)[0]
+        
+        entries.append([current_locctr, line, object_code, mods, flush])
+    
+    program_length = locctr - start_addr
+    
+    # Back-patch forward references now that every symbol is known
+    for index, line_num, opcode, operand, fixup_base in fixups:
+        entry = entries[index]
+        entry[2] = encode_instruction(opcode, operand, symbol_table, entry[0],
+                                      _resolve_base(fixup_base, symbol_table),
+                                      entry[3], line_num)[0]
+    
+    # Build the listing and modification records in source order
+    modification_records = []
+    pass2_output = []
+    for address, line, object_code, mods, flush in entries:
+        if object_code is None:
+            pass2_output.append(f"{address:04X} {line:<30}")
+            continue
+        modification_records.extend(mods)
+        pass2_output.append(f"{address:04X} {line:<30} {object_code}")
+    
+    text_records = build_text_records((address, object_code, flush)
+                                      for address, _, object_code, _, flush in entries
+                                      if object_code is not None)
+    
+    return (symbol_table, start_addr, program_length, program_name, pass1_output,
+            pass2_output, text_records, modification_records, error_count)
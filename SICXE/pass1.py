@@ -4,114 +4,131 @@ Builds symbol table and calculates addresses
 Fixed to handle proper line parsing
 """
 import os
-from .utils import parse_line, parse_operand, is_number, calculate_byte_length, format_hex
-from .constants import OPCODES, DIRECTIVES
+import re
+import functools
+from sys import intern
+from .utils import is_number, calculate_byte_length
+from .constants import OPCODES, OPCODE_SET, DIRECTIVES
 
+# Instruction sizes in bytes, resolved once from the opcode table
+_SIZE_TABLE = {op: (1 if fmt == 1 else 2 if fmt == 2 else 3)
+               for op, (_, fmt) in OPCODES.items()}
+
+# Format 4 (+) sizes, including conditional C-prefixed variants (e.g. +CSTA)
+_SIZE_TABLE_PLUS = {op: 4 for op in OPCODES}
+_SIZE_TABLE_PLUS.update({'C' + op: 4 for op in OPCODES if 'C' + op not in OPCODE_SET})
+
+def _reserve_words(operand):
+    """Size of a RESW directive"""
+    if operand and is_number(operand):
+        return int(operand) * 3
+    raise ValueError(operand)
+
+def _reserve_bytes(operand):
+    """Size of a RESB directive"""
+    if operand and is_number(operand):
+        return int(operand)
+    raise ValueError(operand)
+
+# Directive sizes in bytes (END and START are handled separately)
+_DIRECTIVE_SIZES = {
+    'WORD': lambda operand: 3,
+    'RESW': _reserve_words,
+    'RESB': _reserve_bytes,
+    'BYTE': calculate_byte_length,
+    'BASE': lambda operand: 0,
+    'NOBASE': lambda operand: 0,
+}
+
+def statement_size(opcode, operand, line_num):
+    """
+    Size in bytes of a directive or instruction (START and END excluded)
+    Returns None for an unknown opcode; raises ValueError for a bad directive
+    operand or an unknown format 4 opcode
+    """
+    directive_size = _DIRECTIVE_SIZES.get(opcode)
+    if directive_size is not None:
+        try:
+            return directive_size(operand)
+        except Exception:
+            raise ValueError(f"Line {line_num}: Invalid {opcode} operand: {operand}")
+    
+    if opcode[0] == '+':
+        size = _SIZE_TABLE_PLUS.get(opcode[1:])
+        if size is None:
+            raise ValueError(f"Line {line_num}: Invalid opcode: {opcode[1:]}")
+        return size
+    return _SIZE_TABLE.get(opcode)
+
+# Every mnemonic that can appear in the opcode field, for one-probe checks
+_MNEMONICS = OPCODE_SET | DIRECTIVES
+
+def _is_mnemonic(word):
+    """Check if an upper-cased word is an opcode, directive or +opcode"""
+    return word in _MNEMONICS or (word[:1] == '+' and word[1:] in OPCODE_SET)
+
+# First word, then the raw remainder split into second word and the rest
+_LINE_RE = re.compile(r'\s*(\S+)(?:\s+((\S+)(?:\s+(.*\S))?))?')
+
+@functools.lru_cache(maxsize=4096)
 def enhanced_parse_line(line):
     """
     Enhanced line parser that correctly handles SIC/XE assembly format
     """
-    line = line.strip()
-    if not line or line.startswith(';'):
+    # Remove comments, then split the line with a single regex match
+    m = _LINE_RE.match(line.partition(';')[0])
+    if not m:
         return None, None, None
     
-    # Remove comments
-    if ';' in line:
-        line = line[:line.index(';')].strip()
+    # Words are interned so table and symbol lookups compare by identity
+    first, tail, second, rest = m.groups()
+    first = intern(first)
+    first_word = intern(first.upper())
     
-    if not line:
-        return None, None, None
+    if second is None:
+        # Only one word: an opcode on its own or a label on its own line
+        if _is_mnemonic(first_word):
+            return None, first_word, None
+        return first, None, None
     
-    # Split by whitespace
-    parts = line.split()
-    if not parts:
-        return None, None, None
+    second_word = intern(second.upper())
     
-    label = None
-    opcode = None
-    operand = None
+    # If second word is a known opcode/directive, first word is a label
+    if _is_mnemonic(second_word):
+        return first, second_word, rest
     
-    # Determine if the line starts with a label
-    # A line starts with a label if it doesn't start with whitespace
-    # and the first word is not a known opcode or directive
-    original_line = line
-    starts_with_whitespace = original_line and original_line[0].isspace()
+    # First word might be an opcode
+    if _is_mnemonic(first_word):
+        return None, first_word, tail
     
-    if not starts_with_whitespace and len(parts) >= 2:
-        # Check if first part could be a label
-        first_word = parts[0].upper()
-        second_word = parts[1].upper()
-        
-        # If second word is a known opcode/directive, first word is a label
-        is_second_opcode = (second_word in OPCODES or 
-                           second_word in DIRECTIVES or 
-                           (second_word.startswith('+') and second_word[1:] in OPCODES))
-        
-        if is_second_opcode:
-            label = parts[0]
-            opcode = parts[1].upper()
-            operand = ' '.join(parts[2:]) if len(parts) > 2 else None
-        else:
-            # First word might be an opcode
-            is_first_opcode = (first_word in OPCODES or 
-                              first_word in DIRECTIVES or 
-                              (first_word.startswith('+') and first_word[1:] in OPCODES))
-            
-            if is_first_opcode:
-                opcode = first_word
-                operand = ' '.join(parts[1:]) if len(parts) > 1 else None
-            else:
-                # Treat first word as label if we can't determine opcode
-                label = parts[0]
-                if len(parts) > 1:
-                    opcode = parts[1].upper()
-                    operand = ' '.join(parts[2:]) if len(parts) > 2 else None
-    
-    elif len(parts) >= 1:
-        # Line starts with whitespace or has only one part
-        first_word = parts[0].upper()
-        is_first_opcode = (first_word in OPCODES or 
-                          first_word in DIRECTIVES or 
-                          (first_word.startswith('+') and first_word[1:] in OPCODES))
-        
-        if is_first_opcode:
-            opcode = first_word
-            operand = ' '.join(parts[1:]) if len(parts) > 1 else None
-        else:
-            # Could be a label on its own line
-            label = parts[0]
-    
-    return label, opcode, operand
+    # Treat first word as label if we can't determine opcode
+    return first, second_word, rest
 
 def pass1(intermediate_lines):
-    """Execute Pass 1 of the assembler"""
+    """
+    Execute Pass 1 of the assembler
+    Also returns each line with its parsed fields and address, up to END,
+    for Pass 2, and the number of lines with errors that were only reported
+    """
     symbol_table = {}
     locctr = 0
     start_addr = 0
     program_name = None
     pass1_output = []
-    base_addr = None
+    parsed_lines = []
+    error_count = 0
     
     for line_num, line in enumerate(intermediate_lines, 1):
         original_line = line
         
-        # Use enhanced parsing
-        try:
-            label, opcode, operand = enhanced_parse_line(line)
-        except Exception as e:
-            # Fall back to original parsing if enhanced fails
-            try:
-                label, opcode, operand = parse_line(line)
-            except:
-                # Skip problematic lines but add them to output
-                if line.strip():
-                    pass1_output.append(f"{format_hex(locctr, 4)} {original_line}")
-                continue
+        # Use enhanced parsing (never raises; unparsable lines have no opcode)
+        label, opcode, operand = enhanced_parse_line(line)
+        parsed_lines.append((line, label, opcode, operand, locctr))
         
         # Skip empty lines or lines that couldn't be parsed
         if not opcode:
             if line.strip():  # Only add non-empty lines to output
-                pass1_output.append(f"{format_hex(locctr, 4)} {original_line}")
+                pass1_output.append(f"{locctr:04X} {original_line}")
             continue
         
         # Handle START directive
@@ -131,7 +148,7 @@ def pass1(intermediate_lines):
             if label:
                 program_name = label
             
-            pass1_output.append(f"{format_hex(locctr, 4)} {original_line}")
+            pass1_output.append(f"{locctr:04X} {original_line}")
             continue
         
         # Store current location counter
@@ -143,106 +160,40 @@ def pass1(intermediate_lines):
                 raise ValueError(f"Line {line_num}: Duplicate label: {label}")
             symbol_table[label] = current_locctr
         
-        # Handle directives
-        if opcode in DIRECTIVES:
-            if opcode == 'END':
-                pass1_output.append(f"{format_hex(current_locctr, 4)} {original_line}")
-                break
-            elif opcode == 'WORD':
-                locctr += 3
-            elif opcode == 'RESW':
-                if operand and is_number(operand):
-                    locctr += int(operand) * 3
-                else:
-                    raise ValueError(f"Line {line_num}: Invalid RESW operand: {operand}")
-            elif opcode == 'RESB':
-                if operand and is_number(operand):
-                    locctr += int(operand)
-                else:
-                    raise ValueError(f"Line {line_num}: Invalid RESB operand: {operand}")
-            elif opcode == 'BYTE':
-                try:
-                    locctr += calculate_byte_length(operand)
-                except Exception as e:
-                    raise ValueError(f"Line {line_num}: Invalid BYTE operand: {operand}")
-            elif opcode == 'BASE':
-                # BASE directive doesn't affect locctr
-                pass
-            elif opcode == 'NOBASE':
-                # NOBASE directive doesn't affect locctr
-                pass
+        if opcode == 'END':
+            pass1_output.append(f"{current_locctr:04X} {original_line}")
+            break
         
-        # Handle instructions
-        elif opcode in OPCODES or (opcode and opcode.startswith('+')):
-            base_opcode = opcode[1:] if opcode and opcode.startswith('+') else opcode
-            
-            # Handle conditional opcodes (like CADD)
-            if base_opcode.startswith('C') and len(base_opcode) > 1:
-                # Check if it's a conditional version of a known opcode
-                unconditional_opcode = base_opcode[1:]  # Remove 'C' prefix
-                if unconditional_opcode in OPCODES:
-                    # This is a conditional instruction - treat as Format 3
-                    locctr += 3
-                elif base_opcode in OPCODES:
-                    # It's a regular opcode that happens to start with 'C'
-                    opcode_info = OPCODES[base_opcode]
-                    format_num = opcode_info[1]
-                    
-                    if opcode and opcode.startswith('+'):
-                        locctr += 4  # Format 4
-                    elif format_num == 1:
-                        locctr += 1
-                    elif format_num == 2:
-                        locctr += 2
-                    else:
-                        locctr += 3  # Format 3
-                else:
-                    raise ValueError(f"Line {line_num}: Invalid conditional opcode: {base_opcode}")
-            
-            elif base_opcode not in OPCODES:
-                raise ValueError(f"Line {line_num}: Invalid opcode: {base_opcode}")
-            
-            else:
-                # Regular instruction
-                opcode_info = OPCODES[base_opcode]
-                format_num = opcode_info[1]
-                
-                if opcode and opcode.startswith('+'):
-                    # Format 4
-                    locctr += 4
-                elif format_num == 1:
-                    locctr += 1
-                elif format_num == 2:
-                    locctr += 2
-                else:
-                    # Format 3
-                    locctr += 3
-        else:
+        # Directives and instructions are sized with a single table lookup
+        size = statement_size(opcode, operand, line_num)
+        if size is None:
             # Handle unknown opcodes more gracefully
             print(f"Warning: Line {line_num}: Unknown opcode or directive: {opcode}")
-            # Skip this line but add it to output
-            pass1_output.append(f"{format_hex(current_locctr, 4)} {original_line}")
+            error_count += 1
+            pass1_output.append(f"{current_locctr:04X} {original_line}")
             continue
+        locctr += size
         
-        pass1_output.append(f"{format_hex(current_locctr, 4)} {original_line}")
+        pass1_output.append(f"{current_locctr:04X} {original_line}")
     
     program_length = locctr - start_addr
     
-    return symbol_table, start_addr, program_length, program_name, pass1_output
+    return (symbol_table, start_addr, program_length, program_name, pass1_output,
+            parsed_lines, error_count)
 
 def write_pass1_output(pass1_output, filename):
     """Write Pass 1 output to file"""
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     with open(filename, 'w') as f:
-        for line in pass1_output:
-            f.write(line + '\n')
+        # Single write of the whole listing
+        if pass1_output:
+            f.write('\n'.join(pass1_output) + '\n')
 
 def write_symbol_table(symbol_table, filename):
     """Write symbol table to file"""
     os.makedirs(os.path.dirname(filename), exist_ok=True)
+    # Sort the names only; addresses are fetched while formatting
+    lines = ["Symbol Table:", "Symbol\tAddress", "-" * 20]
+    lines.extend(f"{symbol}\t{symbol_table[symbol]:04X}" for symbol in sorted(symbol_table))
     with open(filename, 'w') as f:
-        f.write("Symbol Table:\n")
-        f.write("Symbol\tAddress\n")
-        f.write("-" * 20 + "\n")
-        for symbol, address in sorted(symbol_table.items()):
-            f.write(f"{symbol}\t{format_hex(address, 4)}\n")
\ No newline at end of file
+        f.write('\n'.join(lines) + '\n')
\ No newline at end of file
@@ -4,41 +4,84 @@ Generates object code and output files
 Enhanced to handle multi-operand instructions
 """
 import os
-from .utils import (parse_line, parse_operand, is_number, format_hex, 
-                  byte_to_object_code, calculate_displacement)
-from .constants import OPCODES, REGISTERS, DIRECTIVES
+import struct
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .utils import (parse_operand, is_number, format_hex, 
+                  byte_to_object_code, PC_RELATIVE, BASE_RELATIVE)
+from .constants import OPCODES, OPCODE_SET, REGISTERS, DIRECTIVES
 
-def pass2(intermediate_lines, symbol_table, start_addr, program_length, program_name):
-    """Execute Pass 2 of the assembler"""
+# Opcode table with the hex value also resolved to an int once at import
+# Format: mnemonic -> (hex_value, int_value, format_number)
+_OPCODE_INFO = {op: (hex_value, int(hex_value, 16), fmt)
+                for op, (hex_value, fmt) in OPCODES.items()}
+
+# Big-endian packers for the 3-byte Format 3 and 4-byte Format 4 encodings
+_pack_format3 = struct.Struct('>BH').pack
+_pack_format4 = struct.Struct('>I').pack
+
+# Conditional C-prefixed mnemonics (e.g. CADD) and the opcode they assemble as
+_COND_REWRITE = {'C' + op: op for op in OPCODES if 'C' + op not in OPCODE_SET}
+
+# Hex digit for each register number, so format 2 skips the formatter
+_NIB = "0123456789ABCDEF"
+
+# Two hex digits for every byte value; record addresses are built from three
+# lookups instead of going through the '06X' formatter
+_HEX2 = tuple(f"{i:02X}" for i in range(256))
+
+def _hex6(value):
+    """Six-digit hex field; values outside 24 bits use the plain formatter"""
+    if 0 <= value <= 0xFFFFFF:
+        return f"{_HEX2[value >> 16]}{_HEX2[(value >> 8) & 0xFF]}{_HEX2[value & 0xFF]}"
+    return f"{value:06X}"
+
+# n/i flag bits for each addressing mode
+_NI_FLAGS = {'simple': 0b11, 'immediate': 0b01, 'indirect': 0b10}
+
+# xbpe nibble bits
+_X_BIT = 0b1000
+_E_BIT = 0b0001
+
+def pass2(parsed_lines, symbol_table, start_addr, program_length, program_name,
+          emit_listing=True, base_addr=None, first_line=1):
+    """
+    Execute Pass 2 of the assembler
+    Takes the (line, label, opcode, operand, address) records from Pass 1, so
+    source lines are not parsed a second time
+    With emit_listing=False no listing lines are built and None is returned
+    in place of the listing
+    base_addr and first_line let a slice of the program start with the BASE
+    register and line numbering in effect at that point
+    """
     locctr = start_addr
-    pass2_output = []
-    text_records = []
+    pass2_output = [] if emit_listing else None
     modification_records = []
-    current_text_record = []
-    current_text_start = None
-    current_text_length = 0
-    base_addr = None
+    # (address, object code, flush) entries for build_text_records
+    text_entries = []
+    
+    # Bind globals and bound methods used on every line to locals
+    directives = DIRECTIVES
+    opcode_set = OPCODE_SET
+    is_num = is_number
+    add_listing = pass2_output.append if emit_listing else None
+    add_text_entry = text_entries.append
     
-    for line_num, line in enumerate(intermediate_lines, 1):
+    for line_num, (line, label, opcode, operand, _) in enumerate(parsed_lines, first_line):
         original_line = line
         
-        try:
-            label, opcode, operand = parse_line(line)
-        except Exception as e:
-            # Skip problematic lines but add them to output
-            pass2_output.append(f"{format_hex(locctr, 4)} {original_line:<30} ERROR: {str(e)}")
-            continue
-        
         # Skip empty lines
         if not opcode:
-            if line.strip():
-                pass2_output.append(f"{format_hex(locctr, 4)} {original_line:<30}")
+            if emit_listing and line.strip():
+                add_listing(f"{locctr:04X} {original_line:<30}")
             continue
         
         # Handle START directive
         if opcode == 'START':
-            pass2_output.append(f"{format_hex(locctr, 4)} {original_line:<30}")
-            if operand and is_number(operand):
+            if emit_listing:
+                add_listing(f"{locctr:04X} {original_line:<30}")
+            if operand and is_num(operand):
                 locctr = int(operand)
             continue
         
@@ -46,172 +89,255 @@ def pass2(intermediate_lines, symbol_table, start_addr, program_length, program_
         object_code = ""
         
         # Handle directives
-        if opcode in DIRECTIVES:
+        if opcode in directives:
             if opcode == 'END':
-                pass2_output.append(f"{format_hex(current_locctr, 4)} {original_line:<30}")
+                if emit_listing:
+                    add_listing(f"{current_locctr:04X} {original_line:<30}")
                 break
             elif opcode == 'WORD':
-                if operand and is_number(operand):
+                if operand and is_num(operand):
                     object_code = format_hex(int(operand), 6)
                     locctr += 3
                 else:
                     raise ValueError(f"Invalid WORD operand: {operand}")
             elif opcode == 'RESW':
-                if operand and is_number(operand):
+                if operand and is_num(operand):
                     locctr += int(operand) * 3
                 else:
                     raise ValueError(f"Invalid RESW operand: {operand}")
                 # Flush current text record for RESW
-                if current_text_record:
-                    text_records.append(create_text_record(current_text_start, current_text_record))
-                    current_text_record = []
-                    current_text_start = None
-                    current_text_length = 0
+                add_text_entry((current_locctr, "", True))
             elif opcode == 'RESB':
-                if operand and is_number(operand):
+                if operand and is_num(operand):
                     locctr += int(operand)
                 else:
                     raise ValueError(f"Invalid RESB operand: {operand}")
                 # Flush current text record for RESB
-                if current_text_record:
-                    text_records.append(create_text_record(current_text_start, current_text_record))
-                    current_text_record = []
-                    current_text_start = None
-                    current_text_length = 0
+                add_text_entry((current_locctr, "", True))
             elif opcode == 'BYTE':
                 object_code = byte_to_object_code(operand)
                 locctr += len(object_code) // 2
             elif opcode == 'BASE':
-                if operand in symbol_table:
-                    base_addr = symbol_table[operand]
-                elif is_number(operand):
-                    base_addr = int(operand)
-                else:
-                    raise ValueError(f"Invalid BASE operand: {operand}")
+                base_addr = symbol_table.get(operand)
+                if base_addr is None:
+                    if is_num(operand):
+                        base_addr = int(operand)
+                    else:
+                        raise ValueError(f"Invalid BASE operand: {operand}")
         
         # Handle instructions
-        elif opcode in OPCODES or opcode.startswith('+'):
-            base_opcode = opcode[1:] if opcode.startswith('+') else opcode
-            
-            # Handle conditional opcodes (like CADD) - special processing
-            if base_opcode.startswith('C') and len(base_opcode) > 1:
-                unconditional_opcode = base_opcode[1:]  # Remove 'C' prefix
-                if unconditional_opcode in OPCODES and base_opcode not in OPCODES:
-                    # This is a conditional instruction - treat as the base instruction
-                    print(f"Warning: Line {line_num}: Treating {base_opcode} as conditional {unconditional_opcode}")
-                    base_opcode = unconditional_opcode
-            
-            if base_opcode not in OPCODES:
-                print(f"Warning: Line {line_num}: Unknown opcode {base_opcode}, generating NOP")
-                object_code = "000000"  # Generate a NOP-like instruction
-                locctr += 3
-            else:
-                opcode_info = OPCODES[base_opcode]
-                opcode_hex = opcode_info[0]
-                format_num = opcode_info[1]
-                
-                try:
-                    if opcode.startswith('+'):
-                        # Format 4
-                        object_code = generate_format4_code(opcode_hex, operand, symbol_table, 
-                                                          current_locctr, modification_records)
-                        locctr += 4
-                    elif format_num == 1:
-                        # Format 1
-                        object_code = opcode_hex
-                        locctr += 1
-                    elif format_num == 2:
-                        # Format 2
-                        object_code = generate_format2_code(opcode_hex, operand)
-                        locctr += 2
-                    else:
-                        # Format 3
-                        object_code = generate_format3_code(opcode_hex, operand, symbol_table, 
-                                                          current_locctr, base_addr, locctr)
-                        locctr += 3
-                except Exception as e:
-                    print(f"Warning: Line {line_num}: Error generating object code for {opcode}: {e}")
-                    # Generate a default object code to continue processing
-                    if format_num == 1:
-                        object_code = opcode_hex
-                        locctr += 1
-                    elif format_num == 2:
-                        object_code = opcode_hex + "00"
-                        locctr += 2
-                    else:
-                        object_code = opcode_hex + "0000"
-                        locctr += 3
+        elif opcode[0] == '+' or opcode in opcode_set:
+            object_code, size = encode_instruction(opcode, operand, symbol_table, current_locctr,
+                                                   base_addr, modification_records, line_num)
+            locctr += size
         
         # Add to text record if we have object code
         if object_code:
-            object_code_bytes = len(object_code) // 2
+            add_text_entry((current_locctr, object_code, False))
+        
+        if emit_listing:
+            add_listing(f"{current_locctr:04X} {original_line:<30} {object_code}")
+    
+    return pass2_output, build_text_records(text_entries), modification_records
+
+def encode_instruction(opcode, operand, symbol_table, current_addr, base_addr,
+                       modification_records, line_num):
+    """
+    Generate object code for one instruction line
+    Returns (object_code, size); encoding errors are reported and replaced
+    by a default object code so assembly can continue
+    """
+    plus = opcode[0] == '+'  # Format 4 marker
+    base_opcode = opcode[1:] if plus else opcode
+    
+    # Handle conditional opcodes (like CADD) - treat as the base instruction
+    unconditional_opcode = _COND_REWRITE.get(base_opcode)
+    if unconditional_opcode is not None:
+        print(f"Warning: Line {line_num}: Treating {base_opcode} as conditional {unconditional_opcode}")
+        base_opcode = unconditional_opcode
+    
+    opcode_info = _OPCODE_INFO.get(base_opcode)
+    if opcode_info is None:
+        print(f"Warning: Line {line_num}: Unknown opcode {base_opcode}, generating NOP")
+        return "000000", 3  # Generate a NOP-like instruction
+    opcode_hex, opcode_int, format_num = opcode_info
+    
+    try:
+        if plus:
+            # Format 4
+            return generate_format4_code(opcode_int, operand, symbol_table,
+                                         current_addr, modification_records), 4
+        elif format_num == 1:
+            # Format 1
+            return opcode_hex, 1
+        elif format_num == 2:
+            # Format 2
+            return generate_format2_code(opcode_hex, operand), 2
+        else:
+            # Format 3
+            return generate_format3_code(opcode_int, operand, symbol_table,
+                                         current_addr, base_addr, current_addr), 3
+    except Exception as e:
+        print(f"Warning: Line {line_num}: Error generating object code for {opcode}: {e}")
+        # Generate a default object code to continue processing
+        if format_num == 1:
+            return opcode_hex, 1
+        elif format_num == 2:
+            return opcode_hex + "00", 2
+        return opcode_hex + "0000", 3
+
+def build_text_records(entries):
+    """
+    Build text records from (address, object_code, flush) entries in source order
+    A flush entry (RESW/RESB) ends the current record; a record also ends when
+    it would exceed 30 bytes or the next object code is not contiguous
+    """
+    text_records = []
+    add_text_record = text_records.append
+    current_text_hex = ""
+    current_text_start = None
+    
+    for address, object_code, flush in entries:
+        if flush and current_text_hex:
+            add_text_record(create_text_record(current_text_start, current_text_hex))
+            current_text_hex = ""
+            current_text_start = None
+        
+        if object_code:
+            # Record length is tracked in hex digits (two per byte)
+            current_text_digits = len(current_text_hex)
             
             # Check if we need to start a new text record
             if (current_text_start is None or 
-                current_text_length + object_code_bytes > 30 or
-                current_locctr != current_text_start + current_text_length):
+                current_text_digits + len(object_code) > 60 or
+                address != current_text_start + current_text_digits // 2):
                 
                 # Flush current text record
-                if current_text_record:
-                    text_records.append(create_text_record(current_text_start, current_text_record))
+                if current_text_hex:
+                    add_text_record(create_text_record(current_text_start, current_text_hex))
                 
                 # Start new text record
-                current_text_record = [object_code]
-                current_text_start = current_locctr
-                current_text_length = object_code_bytes
+                current_text_hex = object_code
+                current_text_start = address
             else:
                 # Add to current text record
-                current_text_record.append(object_code)
-                current_text_length += object_code_bytes
-        
-        pass2_output.append(f"{format_hex(current_locctr, 4)} {original_line:<30} {object_code}")
+                current_text_hex += object_code
     
     # Flush final text record
-    if current_text_record:
-        text_records.append(create_text_record(current_text_start, current_text_record))
+    if current_text_hex:
+        add_text_record(create_text_record(current_text_start, current_text_hex))
     
-    return pass2_output, text_records, modification_records
+    return text_records
 
-def generate_format2_code(opcode_hex, operand):
-    """Generate object code for Format 2 instructions"""
-    if not operand:
-        return opcode_hex + "00"
+def _split_at_reservations(parsed_lines, jobs):
+    """
+    Split Pass 1 records into about `jobs` slices, each ending on a RESW or
+    RESB line where the serial pass flushes its text record anyway
+    """
+    target = -(-len(parsed_lines) // jobs)
+    chunks = []
+    start = 0
+    for index, record in enumerate(parsed_lines):
+        if index + 1 - start >= target and record[2] in ('RESW', 'RESB'):
+            chunks.append(parsed_lines[start:index + 1])
+            start = index + 1
+    if start < len(parsed_lines):
+        chunks.append(parsed_lines[start:])
+    return chunks
+
+def pass2_parallel(parsed_lines, symbol_table, start_addr, program_length, program_name,
+                   jobs):
+    """
+    Execute Pass 2 across `jobs` worker processes
+    Each slice starts after a RESW/RESB line at the address Pass 1 gave it,
+    so the concatenated listing and records match a serial run
+    """
+    chunks = _split_at_reservations(parsed_lines, jobs)
+    if len(chunks) < 2:
+        return pass2(parsed_lines, symbol_table, start_addr, program_length, program_name)
     
+    # Spawned workers: forking while the caller's writer threads run is unsafe
+    with ProcessPoolExecutor(max_workers=jobs,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = []
+        base_addr = None
+        first_line = 1
+        for index, chunk in enumerate(chunks):
+            chunk_start = start_addr if index == 0 else chunk[0][4]
+            futures.append(executor.submit(pass2, chunk, symbol_table, chunk_start,
+                                           program_length, program_name,
+                                           base_addr=base_addr, first_line=first_line))
+            
+            # BASE register carried into the next slice (invalid operands are
+            # reported by the slice that contains them)
+            for _, _, opcode, operand, _ in chunk:
+                if opcode == 'BASE':
+                    addr = symbol_table.get(operand)
+                    if addr is None and is_number(operand):
+                        addr = int(operand)
+                    if addr is not None:
+                        base_addr = addr
+            first_line += len(chunk)
+        
+        # Merge in source order
+        pass2_output = []
+        text_records = []
+        modification_records = []
+        for future in futures:
+            listing, texts, mods = future.result()
+            pass2_output.extend(listing)
+            text_records.extend(texts)
+            modification_records.extend(mods)
+    
+    return pass2_output, text_records, modification_records
+
+@functools.lru_cache(maxsize=256)
+def _parse_format2_registers(operand):
+    """Parse a Format 2 operand into its two register codes"""
     # Handle multi-operand format 2 instructions
     if ',' in operand:
-        # Parse registers
+        # Parse registers; a missing register encodes as 0
         regs = [reg.strip().upper() for reg in operand.split(',')]
-        reg1 = regs[0] if len(regs) > 0 else None
-        reg2 = regs[1] if len(regs) > 1 else None
+        reg1 = regs[0]
+        reg2 = regs[1]
         
-        if reg1 and reg1 not in REGISTERS:
+        # Single probe per register; None means it is not a register name
+        reg1_code = REGISTERS.get(reg1) if reg1 else 0
+        if reg1_code is None:
             raise ValueError(f"Invalid register: {reg1}")
-        if reg2 and reg2 not in REGISTERS:
+        reg2_code = REGISTERS.get(reg2) if reg2 else 0
+        if reg2_code is None:
             raise ValueError(f"Invalid register: {reg2}")
         
-        reg1_code = REGISTERS[reg1] if reg1 else 0
-        reg2_code = REGISTERS[reg2] if reg2 else 0
-        
-        return opcode_hex + format(reg1_code, 'X') + format(reg2_code, 'X')
+        return reg1_code, reg2_code
     else:
         # Single register
         reg = operand.strip().upper()
-        if reg not in REGISTERS:
+        reg_code = REGISTERS.get(reg)
+        if reg_code is None:
             raise ValueError(f"Invalid register: {reg}")
         
-        reg_code = REGISTERS[reg]
-        return opcode_hex + format(reg_code, 'X') + "0"
+        return reg_code, 0
+
+def generate_format2_code(opcode_hex, operand):
+    """Generate object code for Format 2 instructions"""
+    if not operand:
+        return opcode_hex + "00"
+    
+    # Register operands repeat a lot (A,X / X / S,T ...), so parsing is cached
+    reg1_code, reg2_code = _parse_format2_registers(operand)
+    return opcode_hex + _NIB[reg1_code] + _NIB[reg2_code]
 
-def generate_format3_code(opcode_hex, operand, symbol_table, current_addr, base_addr, next_addr):
+def generate_format3_code(opcode_int, operand, symbol_table, current_addr, base_addr, next_addr):
     """Generate object code for Format 3 instructions"""
     if not operand:
         # Instructions like RSUB with no operand
-        return opcode_hex + "0000"
+        return f"{opcode_int:02X}0000"
     
     try:
         value, mode, indexed = parse_operand(operand)
-    except Exception as e:
-        print(f"Warning: Error parsing operand '{operand}': {e}")
+    except Exception as err:
+        print(f"Warning: Error parsing operand '{operand}': {err}")
         # For multi-operand instructions that can't be parsed normally,
         # try to extract the first valid symbol
         if ',' in operand:
@@ -228,131 +354,100 @@ def generate_format3_code(opcode_hex, operand, symbol_table, current_addr, base_
                 mode = 'immediate'
                 indexed = False
         else:
-            raise e
-    
-    # Calculate flags
-    n = 1  # indirect addressing flag
-    i = 1  # immediate addressing flag
-    x = 1 if indexed else 0
-    b = 0  # base-relative flag
-    p = 0  # PC-relative flag
-    e = 0  # extended format flag
+            raise
     
-    # Adjust n and i based on addressing mode
-    if mode == 'immediate':
-        n = 0
-        i = 1
-    elif mode == 'indirect':
-        n = 1
-        i = 0
+    # Calculate flags: n/i from the addressing mode, b/p added below
+    opcode_with_flags = opcode_int | _NI_FLAGS[mode]
+    xbpe = _X_BIT if indexed else 0
     
     # Calculate target address
     if is_number(value):
         target_addr = int(value)
         disp = target_addr
-    elif value in symbol_table:
-        target_addr = symbol_table[value]
-        disp, addr_mode = calculate_displacement(target_addr, next_addr, base_addr)
-        
-        if addr_mode == 'pc':
-            p = 1
-        elif addr_mode == 'base':
-            b = 1
-        # For direct addressing, we'll use the address as is
     else:
-        print(f"Warning: Undefined symbol '{value}', using 0")
-        disp = 0
-    
-    # Ensure displacement fits in 12 bits
-    if disp < 0:
-        disp = disp & 0xFFF  # Two's complement
-    elif disp > 4095:
-        disp = disp & 0xFFF  # Truncate to 12 bits
-    
-    # Build the instruction
-    opcode_int = int(opcode_hex, 16)
-    flags = (n << 1) | i
-    opcode_with_flags = opcode_int | flags
+        # Single symbol table probe; None means the symbol is undefined
+        target_addr = symbol_table.get(value)
+        if target_addr is None:
+            print(f"Warning: Undefined symbol '{value}', using 0")
+            disp = 0
+        else:
+            # Displacement: try PC-relative first, then base-relative,
+            # else direct addressing
+            disp = target_addr - next_addr
+            if -2048 <= disp <= 2047:
+                xbpe |= PC_RELATIVE
+            elif base_addr is not None and 0 <= target_addr - base_addr <= 4095:
+                disp = target_addr - base_addr
+                xbpe |= BASE_RELATIVE
+            else:
+                disp = target_addr
     
-    xbpe = (x << 3) | (b << 2) | (p << 1) | e
+    # Mask to 12 bits: two's complement for negatives, truncation for overflow
+    disp &= 0xFFF
     
-    return format(opcode_with_flags, '02X') + format(xbpe, 'X') + format(disp, '03X')
+    return _pack_format3(opcode_with_flags, (xbpe << 12) | disp).hex().upper()
 
-def generate_format4_code(opcode_hex, operand, symbol_table, current_addr, modification_records):
+def generate_format4_code(opcode_int, operand, symbol_table, current_addr, modification_records):
     """Generate object code for Format 4 instructions"""
     if not operand:
-        return opcode_hex + "000000"
+        return f"{opcode_int:02X}000000"
     
     value, mode, indexed = parse_operand(operand)
     
-    # Calculate flags
-    n = 1  # indirect addressing flag
-    i = 1  # immediate addressing flag
-    x = 1 if indexed else 0
-    b = 0  # base-relative flag (not used in format 4)
-    p = 0  # PC-relative flag (not used in format 4)
-    e = 1  # extended format flag
-    
-    # Adjust n and i based on addressing mode
-    if mode == 'immediate':
-        n = 0
-        i = 1
-    elif mode == 'indirect':
-        n = 1
-        i = 0
+    # Calculate flags: e is always set, b/p are never used in format 4
+    opcode_with_flags = opcode_int | _NI_FLAGS[mode]
+    xbpe = (_X_BIT | _E_BIT) if indexed else _E_BIT
     
     # Calculate target address
     if is_number(value):
         target_addr = int(value)
-    elif value in symbol_table:
-        target_addr = symbol_table[value]
-        # Add modification record for symbol references
-        if mode == 'simple' or mode == 'indirect':
-            mod_addr = current_addr + 1  # Address of the address field
-            modification_records.append(f"M^{format_hex(mod_addr, 6)}^05")
     else:
-        print(f"Warning: Undefined symbol '{value}', using 0")
-        target_addr = 0
-    
-    # Build the instruction
-    opcode_int = int(opcode_hex, 16)
-    flags = (n << 1) | i
-    opcode_with_flags = opcode_int | flags
-    
-    xbpe = (x << 3) | (b << 2) | (p << 1) | e
+        # Single symbol table probe; None means the symbol is undefined
+        target_addr = symbol_table.get(value)
+        if target_addr is None:
+            print(f"Warning: Undefined symbol '{value}', using 0")
+            target_addr = 0
+        elif mode == 'simple' or mode == 'indirect':
+            # Add modification record for symbol references
+            mod_addr = current_addr + 1  # Address of the address field
+            modification_records.append(f"M^{_hex6(mod_addr)}^05")
     
-    return format(opcode_with_flags, '02X') + format(xbpe, 'X') + format(target_addr, '05X')
+    # The address field is 20 bits wide
+    word = (opcode_with_flags << 24) | (xbpe << 20) | (target_addr & 0xFFFFF)
+    return _pack_format4(word).hex().upper()
 
-def create_text_record(start_addr, object_codes):
-    """Create a text record from object codes"""
-    combined_code = ''.join(object_codes)
-    length = len(combined_code) // 2
-    return f"T^{format_hex(start_addr, 6)}^{format_hex(length, 2)}^{combined_code}"
+def create_text_record(start_addr, object_code):
+    """Create a text record from accumulated object code hex"""
+    length = len(object_code) // 2
+    # A single long BYTE constant can exceed the one-byte length field
+    length_hex = _HEX2[length] if length <= 0xFF else f"{length:02X}"
+    return f"T^{_hex6(start_addr)}^{length_hex}^{object_code}"
 
 def write_pass2_output(pass2_output, filename):
     """Write Pass 2 output to file"""
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     with open(filename, 'w') as f:
-        for line in pass2_output:
-            f.write(line + '\n')
+        # Single write of the whole listing
+        if pass2_output:
+            f.write('\n'.join(pass2_output) + '\n')
 
 def write_htme_output(program_name, start_addr, program_length, text_records, 
                      modification_records, entry_point, filename):
     """Write HTME output to file"""
     os.makedirs(os.path.dirname(filename), exist_ok=True)
+    prog_name = (program_name or "PROG").ljust(6)[:6]
+    entry_addr = entry_point if entry_point is not None else start_addr
+    
     with open(filename, 'w') as f:
         # Header record
-        prog_name = (program_name or "PROG").ljust(6)[:6]
-        f.write(f"H^{prog_name}^{format_hex(start_addr, 6)}^{format_hex(program_length, 6)}\n")
-        
-        # Text records
-        for record in text_records:
-            f.write(record + '\n')
+        f.write(f"H^{prog_name}^{start_addr:06X}^{program_length:06X}\n")
         
-        # Modification records
-        for record in modification_records:
-            f.write(record + '\n')
+        # Text and modification records are written straight from pass2's
+        # lists, without first copying them into one combined list
+        for records in (text_records, modification_records):
+            if records:
+                f.write('\n'.join(records))
+                f.write('\n')
         
         # End record
-        entry_addr = entry_point if entry_point is not None else start_addr
-        f.write(f"E^{format_hex(entry_addr, 6)}\n")
\ No newline at end of file
+        f.write(f"E^{entry_addr:06X}\n")
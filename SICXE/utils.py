@@ -3,67 +3,98 @@ Utility functions for SIC/XE Assembler
 Enhanced to handle multi-operand instructions
 """
 import re
+import functools
 import os
-from .constants import OPCODES, REGISTERS, DIRECTIVES
+import contextlib
+from sys import intern
+from .constants import OPCODE_SET, REGISTERS, DIRECTIVES
 
-def create_intermediate_file(input_file, output_file):
-    """Remove comments and line numbers from input file"""
-    with open(input_file, 'r') as f:
-        lines = f.readlines()
-    
-    intermediate_lines = []
-    for line in lines:
+__all__ = [
+    'create_intermediate_file', 'iter_intermediate_file', 'parse_line', 'parse_operand', 'parse_single_operand',
+    'is_number', 'DIRECT', 'BASE_RELATIVE', 'PC_RELATIVE',
+    'format_hex', 'byte_to_object_code', 'calculate_byte_length',
+]
+
+# Leading source line number
+_LINENO_RE = re.compile(r'^\d+\s+')
+
+# Source tokens: runs of non-space text where quoted parts may contain spaces
+_TOKEN_RE = re.compile(r"""(?:[^\s'"]|'[^']*'?|"[^"]*"?)+""")
+
+# Output buffer for the intermediate file, which is written line by line
+_WRITE_BUFFER = 1 << 20
+
+# Comma separator with any surrounding whitespace, for splitting operands
+_WS_COMMA = re.compile(r'\s*,\s*')
+
+def _clean_lines(source):
+    """Yield source lines without line numbers, comments or blanks"""
+    for line in source:
         # Remove line numbers at the beginning
-        line = re.sub(r'^\d+\s+', '', line.strip())
+        line = _LINENO_RE.sub('', line.strip())
         
         # Remove comments (everything after ;)
-        line = re.sub(r';.*$', '', line).strip()
+        line = line.partition(';')[0].strip()
         
-        if line:  # Only add non-empty lines
-            intermediate_lines.append(line)
+        if line:  # Only keep non-empty lines
+            yield line
+
+def iter_intermediate_file(input_file, output_file=None):
+    """
+    Remove comments and line numbers from input file, yielding each cleaned
+    line as it is written so callers never hold the whole program
+    input_file is a path, or an already open text file the caller closes
+    If the caller stops early (e.g. at END), closing the generator writes the
+    remaining lines; with no output_file nothing is written
+    """
+    if isinstance(input_file, (str, os.PathLike)):
+        source = open(input_file, 'r')
+    else:
+        source = contextlib.nullcontext(input_file)
+    
+    if output_file is None:
+        with source as fi:
+            yield from _clean_lines(fi)
+        return
     
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
-    with open(output_file, 'w') as f:
-        for line in intermediate_lines:
-            f.write(line + '\n')
-    
-    return intermediate_lines
+    # Read and write in one streaming pass; a 1 MiB buffer turns the small
+    # per-line writes into a few write syscalls
+    with source as fi, open(output_file, 'w', buffering=_WRITE_BUFFER) as fo:
+        write = fo.write
+        lines = _clean_lines(fi)
+        try:
+            for line in lines:
+                write(line)
+                write('\n')
+                yield line
+        finally:
+            for line in lines:
+                write(line)
+                write('\n')
 
+def create_intermediate_file(input_file, output_file):
+    """Remove comments and line numbers from input file"""
+    return list(iter_intermediate_file(input_file, output_file))
+
+@functools.lru_cache(maxsize=4096)
 def parse_line(line):
-    """Parse assembly line into components"""
+    """
+    Parse assembly line into components
+    Public API only; the passes use pass1.enhanced_parse_line
+    """
     line = line.strip()
     if not line:
         return None, None, None
     
-    # Split by whitespace, but preserve strings in quotes
-    parts = []
-    current_part = ""
-    in_quotes = False
-    quote_char = None
-    
-    i = 0
-    while i < len(line):
-        char = line[i]
-        if char in ("'", '"') and not in_quotes:
-            in_quotes = True
-            quote_char = char
-            current_part += char
-        elif char == quote_char and in_quotes:
-            in_quotes = False
-            quote_char = None
-            current_part += char
-        elif char.isspace() and not in_quotes:
-            if current_part:
-                parts.append(current_part)
-                current_part = ""
-        else:
-            current_part += char
-        i += 1
-    
-    if current_part:
-        parts.append(current_part)
+    # Split by whitespace, but preserve strings in quotes; most lines have
+    # no quotes at all and can use a plain split
+    if "'" not in line and '"' not in line:
+        parts = line.split()
+    else:
+        parts = _TOKEN_RE.findall(line)
     
     if not parts:
         return None, None, None
@@ -76,9 +107,9 @@ def parse_line(line):
     first_part_upper = parts[0].upper()
     
     # Check if it's an opcode (including format 4 with +)
-    is_opcode = (first_part_upper in OPCODES or 
+    is_opcode = (first_part_upper in OPCODE_SET or 
                 first_part_upper in DIRECTIVES or 
-                (first_part_upper.startswith('+') and first_part_upper[1:] in OPCODES))
+                (first_part_upper.startswith('+') and first_part_upper[1:] in OPCODE_SET))
     
     if is_opcode:
         # No label
@@ -93,17 +124,15 @@ def parse_line(line):
     
     return label, opcode, operand
 
+@functools.lru_cache(maxsize=4096)
 def parse_operand(operand):
     """Parse operand to determine addressing mode and value - Enhanced for multi-operand instructions"""
     if not operand:
         return None, 'simple', False
     
-    # Remove spaces for initial processing
-    operand_clean = operand.replace(' ', '')
-    
     # Handle multi-operand instructions (like CADD X,LENGTH,N)
-    if ',' in operand_clean:
-        operands = [op.strip() for op in operand.split(',')]
+    if ',' in operand:
+        operands = _WS_COMMA.split(operand.strip())
         
         # For multi-operand instructions, we'll use the first operand as primary
         # and handle the rest as special cases
@@ -132,6 +161,7 @@ def parse_operand(operand):
     else:
         return parse_single_operand(operand, False)
 
+@functools.lru_cache(maxsize=4096)
 def parse_single_operand(operand, indexed=False):
     """Parse a single operand for addressing mode and value"""
     if not operand:
@@ -156,59 +186,58 @@ def parse_single_operand(operand, indexed=False):
         mode = 'indirect'
         value = operand[1:]
     
-    return value, mode, indexed
+    # Interned like the parsed labels, so symbol table probes hit by identity
+    return intern(value), mode, indexed
+
+# Signed decimal or hexadecimal literal (optionally 0x-prefixed)
+_NUMBER_RE = re.compile(r'[+-]?(?:0[xX])?[0-9A-Fa-f]+')
 
 def is_number(s):
     """Check if string represents a number"""
     if not s:
         return False
-    try:
-        int(s)
+    # Plain decimal operands are the common case; isdecimal (not isdigit)
+    # accepts exactly the digits int() does, so '²' is rejected
+    if s.isdecimal():
         return True
-    except ValueError:
-        # Try hexadecimal
-        try:
-            int(s, 16)
-            return True
-        except ValueError:
-            return False
+    return _NUMBER_RE.fullmatch(s) is not None
 
-def calculate_displacement(target_addr, pc_addr, base_addr=None):
-    """Calculate displacement for PC-relative or base-relative addressing"""
-    # Try PC-relative first
-    pc_disp = target_addr - pc_addr
-    if -2048 <= pc_disp <= 2047:
-        return pc_disp, 'pc'
-    
-    # Try base-relative if base is set
-    if base_addr is not None:
-        base_disp = target_addr - base_addr
-        if 0 <= base_disp <= 4095:
-            return base_disp, 'base'
-    
-    # If neither works, return direct addressing (will need modification record)
-    return target_addr, 'direct'
+# Displacement addressing modes, encoded as the b/p bits of the xbpe
+# nibble so callers can OR them in directly
+DIRECT = 0b0000
+BASE_RELATIVE = 0b0100
+PC_RELATIVE = 0b0010
+
+# Zero-padded hex format specs for the usual field widths
+_HEX_SPECS = {n: f'0{n}X' for n in range(1, 9)}
 
 def format_hex(value, length):
     """Format value as hex string with specified length"""
     if value < 0:
         # Handle negative numbers with two's complement
         value = (1 << (length * 4)) + value
-    return format(value, f'0{length}X')
+    return format(value, _HEX_SPECS.get(length) or f'0{length}X')
 
 def byte_to_object_code(operand):
     """Convert BYTE directive operand to object code"""
     if operand.startswith("C'") and operand.endswith("'"):
-        # Character constant
-        text = operand[2:-1]
-        return ''.join(format(ord(c), '02X') for c in text)
+        # Character constant (one byte per character)
+        return operand[2:-1].encode('latin-1').hex().upper()
     elif operand.startswith("X'") and operand.endswith("'"):
         # Hexadecimal constant
         hex_str = operand[2:-1]
         # Pad with 0 if odd length
         if len(hex_str) % 2 == 1:
             hex_str += '0'
-        return hex_str.upper()
+        # Validate and canonicalize in one step; fromhex skips whitespace,
+        # so also check that every character was a hex digit
+        try:
+            data = bytes.fromhex(hex_str)
+        except ValueError:
+            raise ValueError(f"Invalid BYTE operand: {operand}")
+        if len(data) * 2 != len(hex_str):
+            raise ValueError(f"Invalid BYTE operand: {operand}")
+        return data.hex().upper()
     else:
         raise ValueError(f"Invalid BYTE operand: {operand}")
 
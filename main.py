@@ -4,83 +4,254 @@ Orchestrates the assembly process
 """
 import os
 import sys
-import argparse
-from SICXE.utils import create_intermediate_file
+import hashlib
+import shutil
+import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from SICXE.utils import iter_intermediate_file
 from SICXE.pass1 import pass1, write_pass1_output, write_symbol_table
-from SICXE.pass2 import pass2, write_pass2_output, write_htme_output
+from SICXE.pass2 import pass2, pass2_parallel, write_pass2_output, write_htme_output
+from SICXE.onepass import assemble as assemble_one_pass
+
+# Files produced by a run, relative to the output directory
+OUTPUT_FILES = ("Output/intermediate.txt", "symbTable.txt", "out_pass1.txt",
+                "out_pass2.txt", "HTME.txt")
+
+def source_key(input_file, names):
+    """
+    Cache key for an input file: a hash of its bytes, the output files asked
+    for, this script and the assembler's own modules, so changing any of them invalidates
+    cached results
+    """
+    digest = hashlib.sha256(input_file.read_bytes())
+    digest.update('\0'.join(names).encode())
+    digest.update(Path(__file__).read_bytes())
+    for module in sorted(Path(__file__).parent.glob('SICXE/*.py')):
+        digest.update(module.read_bytes())
+    return digest.hexdigest()
+
+def restore_cached_outputs(cache_dir, output_dir, names):
+    """Copy cached outputs into the output directory; False on a cache miss"""
+    if not cache_dir.is_dir():
+        return False
+    for name in names:
+        target = output_dir / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cache_dir / name, target)
+    return True
+
+def store_cached_outputs(cache_dir, output_dir, names):
+    """Copy fresh outputs into the cache, publishing the entry atomically"""
+    staging = cache_dir.with_name(cache_dir.name + f".{os.getpid()}.tmp")
+    for name in names:
+        target = staging / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(output_dir / name, target)
+    try:
+        os.replace(staging, cache_dir)
+    except OSError:
+        # Another run already stored the same entry
+        shutil.rmtree(staging, ignore_errors=True)
 
 def main():
     """Main function to run the assembler"""
+    # argparse is only imported for command line runs, not by assemble() callers
+    import argparse
+    
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='SIC/XE Assembler')
-    parser.add_argument('--data', required=True, help='Input assembly file path')
+    parser.add_argument('--data', help='Input assembly file path')
     parser.add_argument('--output', default='output', help='Output directory (default: output)')
+    parser.add_argument('--one-pass', action='store_true',
+                        help='Assemble in a single scan, back-patching forward references')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes for Pass 2 (default: 1)')
+    parser.add_argument('--cache', action='store_true',
+                        help='Reuse outputs from an earlier run on the same source '
+                             '(kept under OUTPUT/.cache)')
+    parser.add_argument('--no-intermediate', action='store_true',
+                        help='Do not write Output/intermediate.txt')
+    parser.add_argument('--server', action='store_true',
+                        help='Read "input<TAB>output_dir" lines from stdin and assemble '
+                             'each one in this process')
     
     args = parser.parse_args()
-    input_file = args.data
-    output_dir = args.output
+    options = dict(one_pass=args.one_pass, jobs=args.jobs, cache=args.cache,
+                   intermediate=not args.no_intermediate)
+    if args.server:
+        return serve(sys.stdin, **options)
+    if not args.data:
+        parser.error("the following arguments are required: --data")
+    return assemble(args.data, args.output, **options)
+
+def serve(requests, **options):
+    """
+    Assemble every "input<TAB>output_dir" line from requests, reusing this
+    interpreter and its imported modules for the whole batch
+    Returns True only if every program assembled
+    """
+    success = True
+    for line_num, request in enumerate(requests, 1):
+        request = request.rstrip('\r\n')
+        if not request.strip():
+            continue
+        input_file, sep, output_dir = request.partition('\t')
+        if not sep:
+            print(f"Error: Request {line_num}: expected 'input<TAB>output_dir', got '{request}'")
+            success = False
+        elif not assemble(input_file, output_dir, **options):
+            success = False
+        # Let the caller see each result as soon as it is done
+        sys.stdout.flush()
+    return success
+
+def assemble(input_file, output_dir, one_pass=False, jobs=1, cache=False, intermediate=True):
+    """
+    Assemble input_file, writing every output file into output_dir
+    Returns True on success, False (after reporting the error) on failure
+    """
+    input_file = Path(input_file)
+    output_dir = Path(output_dir)
     
-    # Check if input file exists
-    if not os.path.exists(input_file):
+    # Open the input once up front; a missing file is reported before any
+    # output is created
+    try:
+        source = open(input_file, 'r')
+    except FileNotFoundError:
         print(f"Error: Input file '{input_file}' not found!")
         return False
     
+    # Bound before the try so the finally below can close it on every path
+    intermediate_lines = None
     try:
         # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Create intermediate file
-        print("Creating intermediate file...")
-        intermediate_file = os.path.join(output_dir, "Output/intermediate.txt")
-        intermediate_lines = create_intermediate_file(input_file, intermediate_file)
-        
-        # Pass 1
-        print("Running Pass 1...")
-        symbol_table, start_addr, program_length, program_name, pass1_output = pass1(intermediate_lines)
+        output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Write Pass 1 outputs
-        write_pass1_output(pass1_output, os.path.join(output_dir, "out_pass1.txt"))
-        write_symbol_table(symbol_table, os.path.join(output_dir, "symbTable.txt"))
+        # The intermediate file is only a debugging aid; both passes read
+        # the cleaned lines from memory
+        output_names = OUTPUT_FILES if intermediate else OUTPUT_FILES[1:]
         
-        # Pass 2
-        print("Running Pass 2...")
-        pass2_output, text_records, modification_records = pass2(
-            intermediate_lines, symbol_table, start_addr, program_length, program_name)
+        # Unchanged source: copy the previous outputs instead of assembling
+        if cache:
+            cache_dir = output_dir / ".cache" / source_key(input_file, output_names)
+            if restore_cached_outputs(cache_dir, output_dir, output_names):
+                print(f"Source unchanged, reused cached outputs in '{output_dir}'")
+                return True
         
-        # Write Pass 2 outputs
-        write_pass2_output(pass2_output, os.path.join(output_dir, "out_pass2.txt"))
+        # Create intermediate file, streamed into the first scan
+        if intermediate:
+            print("Creating intermediate file...")
+            intermediate_file = output_dir / "Output" / "intermediate.txt"
+        else:
+            intermediate_file = None
+        intermediate_lines = iter_intermediate_file(source, intermediate_file)
         
-        # Determine entry point
-        entry_point = symbol_table.get(program_name) if program_name else start_addr
+        # Output files are independent, so they are written on worker threads
+        # while assembly continues; pass 1 files are queued as soon as they exist
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            writes = []
+            
+            if one_pass:
+                # Single scan producing both passes' results
+                print("Running one-pass assembly...")
+                (symbol_table, start_addr, program_length, program_name, pass1_output,
+                 pass2_output, text_records, modification_records,
+                 error_count) = assemble_one_pass(intermediate_lines)
+                intermediate_lines.close()  # Writes any lines after END
+                
+                # Write Pass 1 outputs
+                writes.append(executor.submit(write_pass1_output, pass1_output,
+                                              output_dir / "out_pass1.txt"))
+                writes.append(executor.submit(write_symbol_table, symbol_table,
+                                              output_dir / "symbTable.txt"))
+            else:
+                # Pass 1
+                print("Running Pass 1...")
+                (symbol_table, start_addr, program_length, program_name, pass1_output,
+                 parsed_lines, error_count) = pass1(intermediate_lines)
+                intermediate_lines.close()  # Writes any lines after END
+                
+                # Write Pass 1 outputs
+                writes.append(executor.submit(write_pass1_output, pass1_output,
+                                              output_dir / "out_pass1.txt"))
+                writes.append(executor.submit(write_symbol_table, symbol_table,
+                                              output_dir / "symbTable.txt"))
+            
+            # Addresses after an unknown opcode are wrong, so object code would
+            # be garbage; stop once the Pass 1 files are written
+            if error_count:
+                for write in writes:
+                    write.result()
+                print(f"Pass 1 failed with {error_count} error(s); "
+                      f"no object program written")
+                return False
+            
+            if not one_pass:
+                # Pass 2
+                print("Running Pass 2...")
+                if jobs > 1:
+                    pass2_output, text_records, modification_records = pass2_parallel(
+                        parsed_lines, symbol_table, start_addr, program_length, program_name,
+                        jobs)
+                else:
+                    pass2_output, text_records, modification_records = pass2(
+                        parsed_lines, symbol_table, start_addr, program_length, program_name)
+            
+            # Write Pass 2 outputs
+            writes.append(executor.submit(write_pass2_output, pass2_output,
+                                          output_dir / "out_pass2.txt"))
+            
+            # Determine entry point
+            entry_point = symbol_table.get(program_name) if program_name else start_addr
+            
+            # Write HTME output
+            writes.append(executor.submit(write_htme_output, program_name, start_addr,
+                                          program_length, text_records, modification_records,
+                                          entry_point, output_dir / "HTME.txt"))
+            
+            # Re-raise the first write error, if any
+            for write in writes:
+                write.result()
         
-        # Write HTME output
-        write_htme_output(program_name, start_addr, program_length, text_records, 
-                         modification_records, entry_point, os.path.join(output_dir, "HTME.txt"))
+        if cache:
+            store_cached_outputs(cache_dir, output_dir, output_names)
         
-        print("\n" + "="*50)
-        print("Assembly completed successfully!")
-        print("="*50)
-        print(f"Program Name: {program_name or 'N/A'}")
-        print(f"Start Address: {format(start_addr, '06X')}")
-        print(f"Program Length: {format(program_length, '06X')} ({program_length} bytes)")
-        print(f"Symbols Defined: {len(symbol_table)}")
-        print(f"Text Records: {len(text_records)}")
-        print(f"Modification Records: {len(modification_records)}")
-        print(f"\nOutput files generated in '{output_dir}':")
-        print("  - intermediate.txt")
-        print("  - symbTable.txt")
-        print("  - out_pass1.txt")
-        print("  - out_pass2.txt")
-        print("  - HTME.txt")
+        # Build the summary and write it in one call
+        summary = [
+            "",
+            "=" * 50,
+            "Assembly completed successfully!",
+            "=" * 50,
+            f"Program Name: {program_name or 'N/A'}",
+            f"Start Address: {start_addr:06X}",
+            f"Program Length: {program_length:06X} ({program_length} bytes)",
+            f"Symbols Defined: {len(symbol_table)}",
+            f"Text Records: {len(text_records)}",
+            f"Modification Records: {len(modification_records)}",
+            "",
+            f"Output files generated in '{output_dir}':",
+        ]
+        summary.extend(f"  - {Path(name).name}" for name in output_names)
+        sys.stdout.write('\n'.join(summary) + '\n')
         
     except Exception as e:
         print(f"Assembly failed: {e}")
-        import traceback
         traceback.print_exc()
         return False
+    finally:
+        # Close the generator first: it finishes writing the intermediate
+        # file (even after an error) and needs the source still open
+        if intermediate_lines is not None:
+            intermediate_lines.close()
+        source.close()
     
     return True
 
 if __name__ == "__main__":
     success = main()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    # Every output file is closed and the worker pools are joined by now, and
+    # no atexit handlers are registered, so skip interpreter teardown
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0 if success else 1)
\ No newline at end of file